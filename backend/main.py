@@ -6,17 +6,32 @@ Stack: FastAPI + WebSocket + JWT + simulated MQTT IoT sensors
 """
 
 import asyncio
-import json
 import random
 import time
+import threading
+import itertools
+import logging
+import math
+from collections import Counter, defaultdict, deque
 import hashlib
 import hmac
 from datetime import datetime, timedelta
 from typing import Optional
+from contextlib import asynccontextmanager
+from cachetools import TTLCache
+import numpy as np
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import uvicorn
+import orjson
+
+try:
+    import uvloop
+    uvloop.install()
+except ImportError:  # uvloop is not available on Windows
+    uvloop = None
 
 import os
 from dotenv import load_dotenv
@@ -28,106 +43,44 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 
-origins = [
-    "http://localhost:3000",
-    "https://your-project-name.vercel.app", # Add your Vercel link here
-]
-
-
-# 1. IMPORTS (Always first)
-from contextlib import asynccontextmanager
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-# ... keep your other imports like 'uvicorn' or 'json'
-
-# 2. LIFESPAN HANDLER (The new logic)
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    # This runs when you type 'python Main.py'
-    print("🚀 IoT System Starting: Initializing background tasks...")
-    yield 
-    # This runs when you press 'Ctrl + C'
-    print("🛑 IoT System Shutting Down: Cleaning up resources...")
-
-# 3. APP INITIALIZATION (Pass the lifespan here)
-app = FastAPI(lifespan=lifespan)
-
-# 4. CORS SETTINGS (Very important for your React App to connect)
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"], # In production, change this to your Vercel URL
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# 5. YOUR ROUTES (Everything else follows)
-# @app.get("/") ...
-# @app.post("/api/auth/login") ...
-
-@app.post("/api/auth/login") # Ensure NO trailing slash here
-async def login(body: dict):
-    # Use these exact credentials to test
-    users = {"admin": "hackathon2024", "demo": "demo123"}
-    
-    if body.get("username") in users and users[body["username"]] == body.get("password"):
-        token = create_token({"sub": body["username"]})
-        return {"access_token": token, "token_type": "bearer", "user": body["username"]}
-    
-    raise HTTPException(status_code=401, detail="Invalid credentials")
-
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware  # 1. Add this import
-
-app = FastAPI()
-
-# 2. Update this list with your ACTUAL Vercel link
-origins = [
-    "http://localhost:3000",
-    "http://localhost:5173", # Standard Vite port
-    "https://waste-management-ui.vercel.app", # Replace with your real Vercel URL
-]
-
-# 3. Add the middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# ... your @app.get("/") and other routes stay below here ...
-
-
-
-
-
-
-
-
 # ─── JWT Config ────────────────────────────────────────────────────────────────
 SECRET_KEY = "ewaste-iot-hackathon-secret-2024"
 ALGORITHM = "HS256"
+_SECRET_BYTES = SECRET_KEY.encode()
 
 def create_token(data: dict) -> str:
     import base64
     payload = {**data, "exp": (datetime.utcnow() + timedelta(hours=8)).timestamp()}
     header = base64.urlsafe_b64encode(b'{"alg":"HS256","typ":"JWT"}').decode().rstrip("=")
-    body = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
-    sig = hmac.new(SECRET_KEY.encode(), f"{header}.{body}".encode(), hashlib.sha256).digest()
+    body = base64.urlsafe_b64encode(orjson.dumps(payload)).decode().rstrip("=")
+    sig = hmac.new(_SECRET_BYTES, f"{header}.{body}".encode(), hashlib.sha256).digest()
     return f"{header}.{body}.{base64.urlsafe_b64encode(sig).decode().rstrip('=')}"
 
+# Signature-verified payloads keyed by SHA-256(token); exp is still checked on every hit.
+# TTLCache is not thread-safe and get_current_user runs on the threadpool, hence the lock.
+_tok_cache = TTLCache(maxsize=10_000, ttl=10)
+_tok_cache_lock = threading.Lock()
+
 def verify_token(token: str) -> dict:
+    h = hashlib.sha256(token.encode()).digest()
+    with _tok_cache_lock:
+        payload = _tok_cache.get(h)
+    if payload is not None and payload.get("exp", 0) > time.time():
+        return payload
     try:
         import base64
-        parts = token.split(".")
-        body = parts[1] + "=="
-        payload = json.loads(base64.urlsafe_b64decode(body))
+        header, body, sig = token.split(".")
+        expected = hmac.new(_SECRET_BYTES, f"{header}.{body}".encode(), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, base64.urlsafe_b64decode(sig + "==")):
+            raise ValueError("Bad signature")
+        payload = orjson.loads(base64.urlsafe_b64decode(body + "=="))
         if payload.get("exp", 0) < time.time():
             raise ValueError("Token expired")
-        return payload
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid token")
+    with _tok_cache_lock:
+        _tok_cache[h] = payload
+    return payload
 
 security = HTTPBearer()
 
@@ -135,13 +88,43 @@ def get_current_user(creds: HTTPAuthorizationCredentials = Depends(security)):
     return verify_token(creds.credentials)
 
 # ─── App Setup ─────────────────────────────────────────────────────────────────
-app = FastAPI(title="E-Waste IoT API", version="1.0.0")
+logger = logging.getLogger(__name__)
+
+def _log_task_exit(task: asyncio.Task):
+    """Surface crashes in background tasks; otherwise they stay hidden until shutdown"""
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background task %s crashed", task.get_name(), exc_info=task.exception())
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # This runs when you type 'python Main.py'
+    print("🚀 IoT System Starting: Initializing background tasks...")
+    tasks = [
+        asyncio.create_task(iot_simulator(), name="iot_simulator"),
+        asyncio.create_task(manager.flush_loop(), name="flush_loop"),
+    ]
+    for task in tasks:
+        task.add_done_callback(_log_task_exit)
+    yield 
+    # This runs when you press 'Ctrl + C'
+    print("🛑 IoT System Shutting Down: Cleaning up resources...")
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+app = FastAPI(title="E-Waste IoT API", version="1.0.0", default_response_class=ORJSONResponse, lifespan=lifespan)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
 
 # ─── In-Memory Data Store (demo) ───────────────────────────────────────────────
 DEVICES = {}
-EVENTS = []
-ALERTS = []
+EVENTS: deque = deque(maxlen=10_000)
+EVENTS_BY_DEVICE: dict[str, deque] = defaultdict(lambda: deque(maxlen=200))  # chronological per device
+ALERTS: deque = deque(maxlen=1_000)
+EVENTS_BY_DAY: Counter = Counter()
+EVENTS_TOTAL = 0  # all events ever recorded; EVENTS only retains the newest 10k
+# Monotonic ids; len() no longer works once the deques start evicting
+_event_ids = itertools.count()
+_alert_ids = itertools.count()
 
 # E-waste device types
 DEVICE_TYPES = ["Laptop", "Smartphone", "CRT Monitor", "Server Rack", "Battery Pack",
@@ -161,125 +144,266 @@ STATUS_COLORS = {
     "processing": "#c084fc", "recycled": "#34d399", "flagged": "#f87171"
 }
 
+FACILITIES_BY_ID = {f["id"]: f for f in FACILITIES}
+FACILITY_INDEX = {f["id"]: i for i, f in enumerate(FACILITIES)}
+STATUS_CODES = {s: i for i, s in enumerate(STATUSES)}
+FLOAT32_MAX = float(np.finfo(np.float32).max)  # largest value the float32 columns can hold
+
+# ─── Columnar Device Store ─────────────────────────────────────────────────────
+class DeviceTable:
+    """Struct-of-arrays mirror of DEVICES for vectorised analytics.
+    DEVICES stays the source of truth for API payloads; call upsert() after mutating a record.
+    Running aggregates are maintained incrementally so analytics never rescans the columns."""
+
+    def __init__(self, capacity: int = 64):
+        self.ids: list[str] = []
+        self.rows: dict[str, int] = {}
+        self.weight_kg = np.zeros(capacity, dtype=np.float32)
+        self.hazard_score = np.zeros(capacity, dtype=np.float32)
+        self.co2_saved_kg = np.zeros(capacity, dtype=np.float32)
+        self.status_id = np.zeros(capacity, dtype=np.uint8)
+        self.facility_idx = np.zeros(capacity, dtype=np.uint8)
+        self.certified = np.zeros(capacity, dtype=np.bool_)
+        self.status_counts: Counter = Counter()
+        self.total_weight_kg = 0.0
+        self.total_co2_saved_kg = 0.0
+        self.high_hazard_count = 0
+        self.uncertified_count = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _grow(self):
+        for name in ("weight_kg", "hazard_score", "co2_saved_kg", "status_id", "facility_idx", "certified"):
+            col = getattr(self, name)
+            setattr(self, name, np.concatenate([col, np.zeros_like(col)]))
+
+    def upsert(self, device: dict):
+        # Convert everything up front so a bad value raises before any row is allocated or retracted
+        values = (
+            float(device["weight_kg"]), float(device["hazard_score"]), float(device["co2_saved_kg"]),
+            int(device["status_id"]), int(device["facility_idx"]), bool(device["certified_recycler"]),
+        )
+        if not (0 <= values[3] < len(STATUSES) and 0 <= values[4] < len(FACILITIES)):
+            raise ValueError(f"Invalid status/facility code for device {device['id']}")
+        # A NaN/inf could never be retracted from the running totals; check in float32, as stored
+        if not all(math.isfinite(v) and abs(v) <= FLOAT32_MAX for v in values[:3]):
+            raise ValueError(f"Non-finite measurement for device {device['id']}")
+        row = self.rows.get(device["id"])
+        if row is None:
+            row = len(self.ids)
+            if row == len(self.weight_kg):
+                self._grow()
+            self.rows[device["id"]] = row
+            self.ids.append(device["id"])
+        else:
+            self._tally(row, -1)
+        (self.weight_kg[row], self.hazard_score[row], self.co2_saved_kg[row],
+         self.status_id[row], self.facility_idx[row], self.certified[row]) = values
+        self._tally(row, 1)
+
+    def _tally(self, row: int, sign: int):
+        self.status_counts[STATUSES[self.status_id[row]]] += sign
+        self.total_weight_kg += sign * float(self.weight_kg[row])
+        self.total_co2_saved_kg += sign * float(self.co2_saved_kg[row])
+        self.high_hazard_count += sign * bool(self.hazard_score[row] > 7)
+        self.uncertified_count += sign * (not self.certified[row])
+
+    def column(self, name: str) -> np.ndarray:
+        return getattr(self, name)[:len(self.ids)]
+
+DEVICE_TABLE = DeviceTable()
+
+_ts_cache = [0.0, datetime.now()]
+
+def cached_now() -> datetime:
+    """datetime.now(), refreshed at most every 100ms"""
+    t = time.time()
+    if t - _ts_cache[0] > 0.1:
+        _ts_cache[:] = [t, datetime.fromtimestamp(t)]
+    return _ts_cache[1]
+
+def _out(device: dict) -> dict:
+    """API view of a device record: status/facility codes decoded back to their string ids"""
+    out = dict(device)
+    out["status"] = STATUSES[out.pop("status_id")]
+    out["facility_id"] = FACILITIES[out.pop("facility_idx")]["id"]
+    return out
+
+# Serialized WS init frame shared by all connecting clients; reset to None on any device/event change
+_INIT_FRAME: Optional[str] = None
+
+def record_event(event: dict):
+    global _INIT_FRAME, EVENTS_TOTAL
+    _INIT_FRAME = None
+    EVENTS_TOTAL += 1
+    EVENTS.append(event)
+    EVENTS_BY_DEVICE[event["device_id"]].append(event)
+    EVENTS_BY_DAY[event["timestamp"].date()] += 1
+
+_rng = random.Random()
+
 def generate_device_id():
-    return "EW-" + "".join(random.choices("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789", k=8))
+    return "EW-" + "".join(_rng.choices("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789", k=8))
 
 def init_demo_data():
-    for i in range(40):
+    n = 40
+    seeds = zip(_rng.choices(FACILITIES, k=n), _rng.choices(STATUSES, k=n), _rng.choices(DEVICE_TYPES, k=n))
+    for facility, status, dev_type in seeds:
         dev_id = generate_device_id()
-        facility = random.choice(FACILITIES)
-        status = random.choice(STATUSES)
-        weight = round(random.uniform(0.3, 45.0), 2)
-        hazard_score = round(random.uniform(0, 10), 1)
+        weight = round(_rng.uniform(0.3, 45.0), 2)
+        hazard_score = round(_rng.uniform(0, 10), 1)
         
         DEVICES[dev_id] = {
             "id": dev_id,
-            "type": random.choice(DEVICE_TYPES),
+            "type": dev_type,
             "weight_kg": weight,
             "hazard_score": hazard_score,
-            "status": status,
-            "facility_id": facility["id"],
+            "status_id": STATUS_CODES[status],
+            "facility_idx": FACILITY_INDEX[facility["id"]],
             "facility_name": facility["name"],
-            "lat": facility["lat"] + random.uniform(-0.05, 0.05),
-            "lng": facility["lng"] + random.uniform(-0.05, 0.05),
-            "registered_at": (datetime.now() - timedelta(days=random.randint(0, 30))).isoformat(),
-            "last_seen": datetime.now().isoformat(),
-            "rfid_tag": "RFID-" + "".join(random.choices("0123456789ABCDEF", k=12)),
+            "lat": facility["lat"] + _rng.uniform(-0.05, 0.05),
+            "lng": facility["lng"] + _rng.uniform(-0.05, 0.05),
+            "registered_at": datetime.now() - timedelta(days=_rng.randint(0, 30)),
+            "last_seen": datetime.now(),
+            "rfid_tag": "RFID-" + "".join(_rng.choices("0123456789ABCDEF", k=12)),
             "certified_recycler": facility["certified"],
-            "co2_saved_kg": round(weight * random.uniform(1.2, 3.8), 2),
+            "co2_saved_kg": round(weight * _rng.uniform(1.2, 3.8), 2),
         }
+        DEVICE_TABLE.upsert(DEVICES[dev_id])
     
     # Seed some events
     for dev_id in list(DEVICES.keys())[:15]:
-        for _ in range(random.randint(1, 4)):
-            EVENTS.append({
-                "id": len(EVENTS),
+        # Oldest first so EVENTS_BY_DEVICE stays in chronological order
+        hours_ago = sorted((_rng.randint(0, 72) for _ in range(_rng.randint(1, 4))), reverse=True)
+        for h in hours_ago:
+            record_event({
+                "id": next(_event_ids),
                 "device_id": dev_id,
-                "event_type": random.choice(["scan", "status_change", "weight_verified", "hazmat_detected"]),
-                "timestamp": (datetime.now() - timedelta(hours=random.randint(0, 72))).isoformat(),
+                "event_type": _rng.choice(["scan", "status_change", "weight_verified", "hazmat_detected"]),
+                "timestamp": datetime.now() - timedelta(hours=h),
                 "data": {"note": "IoT sensor auto-logged"},
-                "facility_id": DEVICES[dev_id]["facility_id"],
+                "facility_id": FACILITIES[DEVICES[dev_id]["facility_idx"]]["id"],
             })
 
 init_demo_data()
 
 # ─── WebSocket Manager ─────────────────────────────────────────────────────────
 class ConnectionManager:
+    FLUSH_INTERVAL = 0.05  # seconds between coalesced frames
+    OUTBOX_LIMIT = 1_000   # oldest queued messages are dropped beyond this
+
     def __init__(self):
-        self.connections: list[WebSocket] = []
+        self.connections: set[WebSocket] = set()
+        self._outbox: deque = deque(maxlen=self.OUTBOX_LIMIT)
 
     async def connect(self, ws: WebSocket):
         await ws.accept()
-        self.connections.append(ws)
+        self.connections.add(ws)
 
     def disconnect(self, ws: WebSocket):
-        self.connections.remove(ws)
-
-    async def broadcast(self, data: dict):
-        dead = []
-        for ws in self.connections:
+        self.connections.discard(ws)
+
+    def broadcast(self, data: dict):
+        """Queue a message; flush_loop() delivers queued messages as one iot_batch frame"""
+        if self.connections:  # new clients get current state from the init frame
+            self._outbox.append(data)
+
+    async def flush(self):
+        if not self._outbox:
+            return
+        batch = list(self._outbox)
+        self._outbox.clear()
+        # Serialize once, then fan out concurrently
+        raw = orjson.dumps({"type": "iot_batch", "payload": batch}).decode()
+        await asyncio.gather(*(self._send(ws, raw) for ws in list(self.connections)))
+
+    async def _send(self, ws: WebSocket, raw: str):
+        try:
+            await ws.send_text(raw)
+        except Exception:
+            self.connections.discard(ws)
+
+    async def flush_loop(self):
+        while True:
+            await asyncio.sleep(self.FLUSH_INTERVAL)
             try:
-                await ws.send_json(data)
-            except:
-                dead.append(ws)
-        for ws in dead:
-            self.connections.remove(ws)
+                await self.flush()
+            except Exception:
+                # Drop the bad batch rather than stopping live updates for good
+                logger.exception("Dropping WebSocket batch that failed to send")
 
 manager = ConnectionManager()
 
 # ─── IoT Simulator (MQTT-like) ─────────────────────────────────────────────────
+SIM_EVENT_TYPES = ("scan", "status_change", "weight_verified", "hazmat_alert", "gps_update")
+SIM_EVENT_P = np.array([40, 20, 20, 5, 15]) / 100
+
+def sim_samples(batch: int = 1024):
+    """Yields the random draws for one simulator tick, generated in vectorised batches:
+    (delay, device fraction, event index, status index, lat jitter, lng jitter, hazard delta)"""
+    rng = np.random.default_rng()
+    while True:
+        cols = (
+            rng.uniform(1.5, 4.0, batch),
+            rng.random(batch),  # scaled by the live device count at use, so new devices are picked up
+            rng.choice(len(SIM_EVENT_TYPES), batch, p=SIM_EVENT_P),
+            rng.integers(len(STATUSES), size=batch),
+            rng.uniform(-0.002, 0.002, batch),
+            rng.uniform(-0.002, 0.002, batch),
+            rng.uniform(0.5, 2, batch),
+        )
+        yield from zip(*(c.tolist() for c in cols))
+
 async def iot_simulator():
     """Simulates IoT sensor messages arriving from field devices"""
+    samples = sim_samples()
     await asyncio.sleep(2)
     while True:
-        await asyncio.sleep(random.uniform(1.5, 4.0))
+        delay, dev_frac, event_idx, status_idx, d_lat, d_lng, d_hazard = next(samples)
+        await asyncio.sleep(delay)
         
         if not DEVICES:
             continue
             
-        dev_id = random.choice(list(DEVICES.keys()))
+        dev_id = DEVICE_TABLE.ids[int(dev_frac * len(DEVICE_TABLE))]
         device = DEVICES[dev_id]
-        event_type = random.choices(
-            ["scan", "status_change", "weight_verified", "hazmat_alert", "gps_update"],
-            weights=[40, 20, 20, 5, 15]
-        )[0]
+        event_type = SIM_EVENT_TYPES[event_idx]
         
-        update = {"device_id": dev_id, "timestamp": datetime.now().isoformat(), "event": event_type}
+        now = cached_now()
+        update = {"device_id": dev_id, "timestamp": now, "event": event_type}
         
         if event_type == "status_change":
-            new_status = random.choice(STATUSES)
-            DEVICES[dev_id]["status"] = new_status
+            new_status = STATUSES[status_idx]
+            DEVICES[dev_id]["status_id"] = status_idx
             update["new_status"] = new_status
             
         elif event_type == "gps_update":
-            DEVICES[dev_id]["lat"] += random.uniform(-0.002, 0.002)
-            DEVICES[dev_id]["lng"] += random.uniform(-0.002, 0.002)
+            DEVICES[dev_id]["lat"] += d_lat
+            DEVICES[dev_id]["lng"] += d_lng
             update["lat"] = DEVICES[dev_id]["lat"]
             update["lng"] = DEVICES[dev_id]["lng"]
             
         elif event_type == "hazmat_alert":
-            DEVICES[dev_id]["hazard_score"] = min(10, DEVICES[dev_id]["hazard_score"] + random.uniform(0.5, 2))
+            DEVICES[dev_id]["hazard_score"] = min(10, DEVICES[dev_id]["hazard_score"] + d_hazard)
             alert = {
-                "id": len(ALERTS),
+                "id": next(_alert_ids),
                 "device_id": dev_id,
                 "type": "HAZMAT",
                 "message": f"High hazard material detected in {device['type']}",
                 "severity": "high" if device["hazard_score"] > 7 else "medium",
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": now,
             }
             ALERTS.append(alert)
             update["alert"] = alert
             if not DEVICES[dev_id]["certified_recycler"]:
-                DEVICES[dev_id]["status"] = "flagged"
+                DEVICES[dev_id]["status_id"] = STATUS_CODES["flagged"]
         
-        DEVICES[dev_id]["last_seen"] = datetime.now().isoformat()
-        EVENTS.append({"id": len(EVENTS), "device_id": dev_id, **update, "facility_id": DEVICES[dev_id]["facility_id"]})
+        DEVICES[dev_id]["last_seen"] = now
+        DEVICE_TABLE.upsert(DEVICES[dev_id])
+        record_event({"id": next(_event_ids), "device_id": dev_id, **update, "facility_id": FACILITIES[DEVICES[dev_id]["facility_idx"]]["id"]})
         
-        await manager.broadcast({"type": "iot_event", "payload": update, "device": DEVICES[dev_id]})
-
-@app.on_event("startup")
-async def startup():
-    asyncio.create_task(iot_simulator())
+        manager.broadcast({"type": "iot_event", "payload": update, "device": _out(DEVICES[dev_id])})
 
 # ─── Auth Endpoints ────────────────────────────────────────────────────────────
 @app.post("/api/auth/login")
@@ -293,89 +417,109 @@ async def login(body: dict):
 # ─── Device Endpoints ──────────────────────────────────────────────────────────
 @app.get("/api/devices")
 async def list_devices(status: Optional[str] = None, user=Depends(get_current_user)):
-    devs = list(DEVICES.values())
     if status:
-        devs = [d for d in devs if d["status"] == status]
+        if status not in STATUS_CODES:
+            devs = []
+        else:
+            rows = np.flatnonzero(DEVICE_TABLE.column("status_id") == STATUS_CODES[status])
+            devs = [_out(DEVICES[DEVICE_TABLE.ids[i]]) for i in rows]
+    else:
+        devs = [_out(d) for d in DEVICES.values()]
     return {"devices": devs, "total": len(devs)}
 
 @app.get("/api/devices/{device_id}")
 async def get_device(device_id: str, user=Depends(get_current_user)):
     if device_id not in DEVICES:
         raise HTTPException(404, "Device not found")
-    device_events = [e for e in EVENTS if e["device_id"] == device_id]
-    return {"device": DEVICES[device_id], "events": sorted(device_events, key=lambda x: x["timestamp"], reverse=True)[:20]}
+    device_events = list(itertools.islice(reversed(EVENTS_BY_DEVICE.get(device_id, ())), 20))
+    return {"device": _out(DEVICES[device_id]), "events": device_events}
 
 @app.post("/api/devices/register")
 async def register_device(body: dict, user=Depends(get_current_user)):
+    global _INIT_FRAME
     dev_id = generate_device_id()
-    facility = next((f for f in FACILITIES if f["id"] == body.get("facility_id")), FACILITIES[0])
-    DEVICES[dev_id] = {
+    facility_id = body.get("facility_id")
+    facility = FACILITIES_BY_ID.get(facility_id, FACILITIES[0]) if isinstance(facility_id, str) else FACILITIES[0]
+    try:
+        weight = float(body.get("weight_kg", 1.0))
+    except (TypeError, ValueError):
+        weight = math.nan
+    if not (math.isfinite(weight) and abs(weight) <= FLOAT32_MAX):
+        raise HTTPException(422, "weight_kg must be a number")
+    dev_type = body.get("type", "Unknown")
+    if not isinstance(dev_type, str):
+        raise HTTPException(422, "type must be a string")
+    device = {
         "id": dev_id,
-        "type": body.get("type", "Unknown"),
-        "weight_kg": body.get("weight_kg", 1.0),
+        "type": dev_type,
+        "weight_kg": weight,
         "hazard_score": 0.0,
-        "status": "collected",
-        "facility_id": facility["id"],
+        "status_id": STATUS_CODES["collected"],
+        "facility_idx": FACILITY_INDEX[facility["id"]],
         "facility_name": facility["name"],
         "lat": facility["lat"],
         "lng": facility["lng"],
-        "registered_at": datetime.now().isoformat(),
-        "last_seen": datetime.now().isoformat(),
-        "rfid_tag": "RFID-" + "".join(random.choices("0123456789ABCDEF", k=12)),
+        "registered_at": cached_now(),
+        "last_seen": cached_now(),
+        "rfid_tag": "RFID-" + "".join(_rng.choices("0123456789ABCDEF", k=12)),
         "certified_recycler": facility["certified"],
         "co2_saved_kg": 0,
     }
-    await manager.broadcast({"type": "new_device", "payload": DEVICES[dev_id]})
-    return {"device": DEVICES[dev_id]}
+    DEVICE_TABLE.upsert(device)
+    DEVICES[dev_id] = device
+    _INIT_FRAME = None
+    payload = _out(device)
+    manager.broadcast({"type": "new_device", "payload": payload})
+    return {"device": payload}
 
 # ─── Analytics ─────────────────────────────────────────────────────────────────
 @app.get("/api/analytics/summary")
 async def analytics_summary(user=Depends(get_current_user)):
-    devs = list(DEVICES.values())
-    status_counts = {}
-    for d in devs:
-        status_counts[d["status"]] = status_counts.get(d["status"], 0) + 1
-    
-    total_weight = sum(d["weight_kg"] for d in devs)
-    total_co2 = sum(d["co2_saved_kg"] for d in devs)
-    flagged = [d for d in devs if d["status"] == "flagged"]
-    high_hazard = [d for d in devs if d["hazard_score"] > 7]
-    uncertified = [d for d in devs if not d["certified_recycler"]]
-    
+    t = DEVICE_TABLE
+    n = len(t)
+    status_counts = {k: v for k, v in t.status_counts.items() if v}
+    flagged = status_counts.get("flagged", 0)
+
     return {
-        "total_devices": len(devs),
-        "total_weight_kg": round(total_weight, 2),
-        "total_co2_saved_kg": round(total_co2, 2),
+        "total_devices": n,
+        "total_weight_kg": round(t.total_weight_kg, 2),
+        "total_co2_saved_kg": round(t.total_co2_saved_kg, 2),
         "status_breakdown": status_counts,
-        "flagged_count": len(flagged),
-        "high_hazard_count": len(high_hazard),
-        "uncertified_facility_count": len(uncertified),
+        "flagged_count": flagged,
+        "high_hazard_count": t.high_hazard_count,
+        "uncertified_facility_count": t.uncertified_count,
         "recycled_count": status_counts.get("recycled", 0),
-        "compliance_rate": round((len(devs) - len(flagged)) / max(len(devs), 1) * 100, 1),
+        "compliance_rate": round((n - flagged) / max(n, 1) * 100, 1),
         "facilities": FACILITIES,
-        "recent_alerts": ALERTS[-10:][::-1],
-        "events_today": len([e for e in EVENTS if e["timestamp"][:10] == datetime.now().strftime("%Y-%m-%d")]),
+        "recent_alerts": list(itertools.islice(reversed(ALERTS), 10)),
+        "events_today": EVENTS_BY_DAY[datetime.now().date()],
     }
 
 @app.get("/api/facilities")
 async def get_facilities(user=Depends(get_current_user)):
-    enriched = []
-    for f in FACILITIES:
-        f_devs = [d for d in DEVICES.values() if d["facility_id"] == f["id"]]
-        enriched.append({**f, "device_count": len(f_devs), "weight_kg": round(sum(d["weight_kg"] for d in f_devs), 2)})
+    fac = DEVICE_TABLE.column("facility_idx")
+    counts = np.bincount(fac, minlength=len(FACILITIES))
+    weights = np.bincount(fac, weights=DEVICE_TABLE.column("weight_kg"), minlength=len(FACILITIES))
+    enriched = [
+        {**f, "device_count": int(counts[i]), "weight_kg": round(float(weights[i]), 2)}
+        for i, f in enumerate(FACILITIES)
+    ]
     return {"facilities": enriched}
 
 # ─── WebSocket ─────────────────────────────────────────────────────────────────
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
+    global _INIT_FRAME
     await manager.connect(websocket)
     try:
         # Send initial state
-        await websocket.send_json({
-            "type": "init",
-            "devices": list(DEVICES.values()),
-            "recent_events": EVENTS[-20:][::-1],
-        })
+        if _INIT_FRAME is None:
+            _INIT_FRAME = orjson.dumps({
+                "type": "init",
+                "devices": [_out(d) for d in DEVICES.values()],
+                "recent_events": list(itertools.islice(reversed(EVENTS), 20)),
+            }).decode()
+        await websocket.send_text(_INIT_FRAME)
         while True:
             await websocket.receive_text()
     except WebSocketDisconnect:
@@ -383,7 +527,11 @@ async def websocket_endpoint(websocket: WebSocket):
 
 @app.get("/health")
 async def health():
-    return {"status": "ok", "devices": len(DEVICES), "events": len(EVENTS)}
+    return {"status": "ok", "devices": len(DEVICES), "events": EVENTS_TOTAL, "events_retained": len(EVENTS)}
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    uvicorn.run(
+        "main:app", host="0.0.0.0", port=8000, reload=True,
+        loop="uvloop" if uvloop else "asyncio", http="httptools", ws="websockets",
+        ws_per_message_deflate=True,  # JSON frames compress well; negotiated per client
+    )
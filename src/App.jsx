@@ -331,11 +331,12 @@ function Dashboard({ authFetch, user, onLogout }) {
       ws.onopen = () => setWsStatus("live");
       ws.onclose = () => { setWsStatus("reconnecting"); setTimeout(connect, 3000); };
       ws.onerror = () => setWsStatus("error");
-      ws.onmessage = (e) => {
-        const msg = JSON.parse(e.data);
+      const handle = (msg) => {
         if (msg.type === "init") {
           setDevices(msg.devices || []);
           setEvents(msg.recent_events || []);
+        } else if (msg.type === "iot_batch") {
+          msg.payload.forEach(handle);
         } else if (msg.type === "iot_event") {
           setEvents(prev => [msg.payload, ...prev.slice(0, 49)]);
           if (msg.device) {
@@ -345,6 +346,7 @@ function Dashboard({ authFetch, user, onLogout }) {
           setDevices(prev => [msg.payload, ...prev]);
         }
       };
+      ws.onmessage = (e) => handle(JSON.parse(e.data));
     };
     connect();
     return () => wsRef.current?.close();